@@ -1,9 +1,14 @@
 import streamlit as st
-import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+from matplotlib.patches import Rectangle
 import numpy as np
 from io import BytesIO
 from PIL import Image
 import requests
+import threading
 
 # Basic color options
 COLOR_OPTIONS = {
@@ -18,91 +23,126 @@ COLOR_OPTIONS = {
     "Gray": "#808080",
     "Yellow": "#FFFF00"
 }
+COLOR_NAMES = tuple(COLOR_OPTIONS)
+# Colors parsed to RGBA once, so Matplotlib does not re-parse hex strings on every render
+COLOR_RGBA = {name: mcolors.to_rgba(hex_color) for name, hex_color in COLOR_OPTIONS.items()}
 DIRECTION_OPTIONS = ["Up", "Down", "Left", "Right"]
 
+# Unit vectors for each direction, indexed by DIRECTION_CODES
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTION_OPTIONS)}
+DIRECTION_VECTORS = np.array([[0.0, 1.0], [0.0, -1.0], [-1.0, 0.0], [1.0, 0.0]])
+
+# Label fonts, shared by every text artist instead of being resolved per call
+LABEL_FONT = FontProperties(size=12, weight='bold')
+MOTION_LABEL_FONT = FontProperties(size=10, weight='bold')
+
+# Resolution of the on-screen preview and of the downloaded file
+PREVIEW_DPI = 72
+EXPORT_DPI = 200
+
+# Colors kept in exported PNGs: the force palette, black, gray and their antialiased edges
+PNG_PALETTE_SIZE = 64
+
 TITLE_IMAGE_URL = "https://github.com/kolbm/FreeBody/blob/main/title.jpg?raw=true"
 
+# Function to fetch the title image, cached so reruns do not download it again
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_title_image():
+    response = requests.get(TITLE_IMAGE_URL, timeout=10)
+    response.raise_for_status()
+    return response.content
+
 # Function to display the title image
 def display_title_image():
     try:
-        response = requests.get(TITLE_IMAGE_URL)
-        response.raise_for_status()
-        image = Image.open(BytesIO(response.content))
-        st.image(image, use_container_width=True)
+        st.image(fetch_title_image(), use_container_width=True)
     except Exception as e:
         st.warning("Could not load title image. Using text title instead.")
         st.title("Free Body Diagram Generator")
 
+# Function to get the figure state reused across this session's renders
+def get_figure_state():
+    if "fbd_state" not in st.session_state:
+        # Plain Figure on an Agg canvas, outside pyplot's global figure manager
+        fig = Figure(figsize=(8, 8), dpi=100)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        fig.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.98)  # Fixed layout, so saving needs no tight bbox pass
+        ax.set_aspect('equal', adjustable='box')
+        ax.axis('off')  # Clean layout without axes
+        ax.set_autoscale_on(False)  # Limits are set explicitly on every render
+        rect = ax.add_patch(Rectangle((0, 0), 1, 1, fill=False, linewidth=2, color="black"))  # Resized on every render
+        caption = fig.text(0.5, 0.01, "", ha="center", fontsize=10, color='gray')
+        st.session_state.fbd_state = {"fig": fig, "ax": ax, "rect": rect, "caption": caption, "labels": [], "artists": [], "lock": threading.Lock()}
+    return st.session_state.fbd_state
+
 # Function to draw Free Body Diagram
-def draw_fbd(forces, directions, labels, colors, caption, motion_arrow, simple_mode, angled_mode, angles, motion_direction):
+def draw_fbd(state, forces, directions, labels, colors, caption, motion_arrow, simple_mode, angled_mode, angles, motion_direction):
+    # Arrow magnitudes (unit length in simple mode, missing forces are skipped)
+    magnitudes = np.array([1 if simple_mode else (force or 0) for force in forces], dtype=float)
+
     # Calculate the rectangle size based on the smallest arrow length
-    max_force = max(forces) if forces else 1
+    max_force = magnitudes.max() if magnitudes.size else 1
     rect_size = max(max_force * 0.5, 1)  # Ensure minimum box size for readability
-    fig, ax = plt.subplots(figsize=(8, 8), dpi=100)
-    ax.set_aspect('equal', adjustable='box')
-    ax.axis('off')  # Clean layout without axes
-
-    # Draw rectangle representing the object
-    ax.add_patch(plt.Rectangle((-rect_size / 2, -rect_size / 2), rect_size, rect_size, fill=False, linewidth=2, color="black"))
-
-    # Direction mapping
-    direction_map = {"Up": (0, 1), "Down": (0, -1), "Left": (-1, 0), "Right": (1, 0)}
-
-    # Draw forces and labels
-    for i in range(len(forces)):
-        force = forces[i] if not simple_mode else 1
-        if force is None or force <= 0:
-            continue
-
-        if angled_mode:
-            angle = np.radians(angles[i])
-            dx = force * 0.5 * np.cos(angle)
-            dy = force * 0.5 * np.sin(angle)
-        else:
-            dx, dy = [component * force * 0.5 for component in direction_map[directions[i]]]
-
-        # Adjust arrowhead size for simple mode
-        head_width = 0.3 if simple_mode else 0.4
-        head_length = 0.3 if simple_mode else 0.5
-
-        # Draw vector arrow
-        ax.arrow(0, 0, dx, dy, head_width=head_width, head_length=head_length, fc=colors[i], ec=colors[i], linewidth=2)
-
-        # Label without magnitude for simple mode
-        if simple_mode:
-            label_with_magnitude = f"{labels[i]}"
-        else:
-            label_with_magnitude = f"{labels[i]} ({force}N)"
-
-        # Label positioning outside the box
-        offset = 1.2  # Offset factor to move labels outside the box
-        if directions[i] == "Right":
-            label_x = dx * offset
-            label_y = dy + 0.5  # Shift upward to avoid overlapping with the arrow
-            rotation_angle = 0
-        elif directions[i] == "Left":
-            label_x = dx * offset
-            label_y = dy + 0.5  # Shift upward to avoid overlapping
-            rotation_angle = 0
-        elif directions[i] == "Up":
-            label_x = dx + 0.5
-            label_y = dy * offset
-            rotation_angle = 0
-        else:  # Down
-            label_x = dx + 0.5
-            label_y = dy * offset
-            rotation_angle = 0
-
-        ax.text(label_x, label_y, label_with_magnitude, fontsize=12, fontweight='bold', color=colors[i], ha='center', va='center', rotation=rotation_angle)
+    fig, ax, artists = state["fig"], state["ax"], state["artists"]
+
+    # Remove the artists added by the previous render
+    for artist in artists:
+        artist.remove()
+    artists.clear()
+
+    # Resize the rectangle representing the object
+    state["rect"].set_bounds(-rect_size / 2, -rect_size / 2, rect_size, rect_size)
+
+    # Compute all arrow components at once
+    if angled_mode:
+        radians = np.radians(np.asarray(angles, dtype=float))
+        unit_vectors = np.column_stack((np.cos(radians), np.sin(radians)))
+    else:
+        codes = np.fromiter((DIRECTION_CODES[d] for d in directions), dtype=int, count=len(directions))
+        unit_vectors = DIRECTION_VECTORS[codes]
+    deltas = magnitudes[:, None] * 0.5 * unit_vectors
+
+    # Adjust arrowhead size for simple mode
+    head_width = 0.3 if simple_mode else 0.4
+    head_length = 0.3 if simple_mode else 0.5
+
+    # Draw all force arrows as a single quiver, with the head past (dx, dy) as ax.arrow draws it
+    drawn = np.flatnonzero(magnitudes > 0)
+    if drawn.size:
+        shaft_width = rect_size * 0.02
+        tips = deltas[drawn] + head_length * unit_vectors[drawn]
+        artists.append(ax.quiver(np.zeros(drawn.size), np.zeros(drawn.size), tips[:, 0], tips[:, 1], color=[colors[i] for i in drawn],
+                  angles='xy', scale_units='xy', scale=1, units='xy', width=shaft_width,
+                  headwidth=head_width / shaft_width, headlength=head_length / shaft_width, headaxislength=head_length / shaft_width))
+
+    # Label positions outside the box: horizontal forces shift upward, all others to the right
+    offset = 1.2  # Offset factor to move labels outside the box
+    horizontal = np.isin(np.asarray(directions)[drawn], ("Left", "Right"))[:, None]
+    label_xy = np.where(horizontal, deltas[drawn] * [offset, 1] + [0, 0.5], deltas[drawn] * [1, offset] + [0.5, 0])
+
+    # Label without magnitude for simple mode
+    label_texts = [labels[i] if simple_mode else f"{labels[i]} ({forces[i]}N)" for i in drawn]
+
+    # Reuse the label texts of earlier renders, creating or hiding texts as the force count changes
+    texts = state["labels"]
+    texts.extend(ax.text(0, 0, "", fontproperties=LABEL_FONT, ha='center', va='center') for _ in range(drawn.size - len(texts)))
+    for text, (label_x, label_y), label_text, i in zip(texts, label_xy, label_texts, drawn):
+        text.set_position((label_x, label_y))
+        text.set_text(label_text)
+        text.set_color(colors[i])
+        text.set_visible(True)
+    for text in texts[drawn.size:]:
+        text.set_visible(False)
 
     # Add motion arrow outside the box, same size as the largest force arrow
     if motion_arrow:
-        motion_dx, motion_dy = direction_map[motion_direction]
+        motion_dx, motion_dy = DIRECTION_VECTORS[DIRECTION_CODES[motion_direction]]
         arrow_length = max_force * 0.5  # Same size as the largest force arrow
         motion_x = -rect_size * 1.8 if motion_dx == 0 else -rect_size * 1.5
         motion_y = -rect_size * 1.8 if motion_dy == 0 else -rect_size * 1.5
 
-        ax.arrow(motion_x, motion_y, arrow_length * motion_dx, arrow_length * motion_dy, head_width=head_width, head_length=head_length, fc="black", ec="black", linewidth=2)
+        artists.append(ax.arrow(motion_x, motion_y, arrow_length * motion_dx, arrow_length * motion_dy, head_width=head_width, head_length=head_length, fc="black", ec="black", linewidth=2))
 
         # Label placement for direction of motion
         if motion_direction in ["Left", "Right"]:
@@ -114,17 +154,32 @@ def draw_fbd(forces, directions, labels, colors, caption, motion_arrow, simple_m
             label_y = motion_y + (arrow_length * motion_dy / 2)
             rotation_angle = 0
 
-        ax.text(label_x, label_y, "Direction of Motion", fontsize=10, fontweight='bold', ha='center', va='center', color="black", rotation=rotation_angle)
+        artists.append(ax.text(label_x, label_y, "Direction of Motion", fontproperties=MOTION_LABEL_FONT, ha='center', va='center', color="black", rotation=rotation_angle))
 
-    # Add caption
-    plt.figtext(0.5, 0.01, caption, ha="center", fontsize=10, color='gray')
+    # Update the caption in place
+    state["caption"].set_text(caption)
 
     ax.set_xlim(-rect_size * 2.5, rect_size * 2.5)
     ax.set_ylim(-rect_size * 2.5, rect_size * 2.5)
-    plt.tight_layout()
-    plt.close(fig)
     return fig
 
+# Function to serialize the diagram in a given format and resolution, cached on the diagram inputs, format and dpi
+@st.cache_data(show_spinner=False, max_entries=128)
+def serialize(inputs, fmt, dpi, _state):
+    # Downloads render on Streamlit's download thread, so serialize access to the session figure
+    with _state["lock"]:
+        fig = draw_fbd(_state, *inputs)
+        fig.set_dpi(dpi)
+        buf = BytesIO()
+        if fmt == "png":
+            # The diagram is line art with few colors, so a palette PNG is far smaller than RGBA
+            fig.canvas.draw()
+            image = Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).convert("RGB")
+            image.quantize(colors=PNG_PALETTE_SIZE, method=Image.Quantize.MEDIANCUT).save(buf, format="PNG", compress_level=3)  # Fast zlib level; the palette image is already small
+        else:
+            fig.savefig(buf, format=fmt, dpi=dpi)
+    return buf.getvalue()
+
 # Streamlit UI
 def main():
     display_title_image()
@@ -141,57 +196,70 @@ def main():
     motion_arrow = st.checkbox("Show direction of motion arrow", value=True)
     motion_direction = st.selectbox("Direction of motion:", DIRECTION_OPTIONS, index=0)
 
-    # User inputs for forces
-    forces = []
-    directions = []
-    labels = []
-    colors = []
-    angles = []
-
-    for i in range(num_forces):
-        st.write(f"### Force {i+1}")
-        col1, col2, col3, col4 = st.columns(4)
-
-        with col1:
-            if not simple_mode:
-                magnitude = st.number_input(f"Magnitude of Force {i+1} (N):", min_value=0, value=5)
-            else:
-                magnitude = 1  # Default for simple mode
-
-        with col2:
-            if not angled_mode:
-                direction = st.selectbox(f"Direction of Force {i+1}", DIRECTION_OPTIONS, index=i % len(DIRECTION_OPTIONS), key=f"dir_{i}")
-                angles.append(0)
-            else:
-                direction = ""  # Use angles for direction in angled mode
-                angle = st.number_input(f"Angle for Force {i+1} (degrees):", value=0)
-                angles.append(angle)
-
-        with col3:
-            label = st.text_input(f"Label for Force {i+1}", f"Force {i+1}")
-
-        with col4:
-            color = st.selectbox(f"Color for Force {i+1}", list(COLOR_OPTIONS.keys()), index=i % len(COLOR_OPTIONS), key=f"color_{i}")
-
-        forces.append(magnitude)
-        directions.append(direction)
-        labels.append(label)
-        colors.append(COLOR_OPTIONS[color])
-
-    if st.button("Generate Diagram"):
+    # One table row per force; rows keep earlier values and new rows cycle through directions and colors
+    previous = st.session_state.get("force_rows", {})
+    force_rows = {
+        "Label": [f"Force {i+1}" for i in range(num_forces)],
+        "Magnitude (N)": [5] * num_forces,
+        "Direction": [DIRECTION_OPTIONS[i % len(DIRECTION_OPTIONS)] for i in range(num_forces)],
+        "Angle (degrees)": [0] * num_forces,
+        "Color": [COLOR_NAMES[i % len(COLOR_NAMES)] for i in range(num_forces)],
+    }
+    for column, values in previous.items():
+        kept = values[:num_forces]
+        force_rows[column][:len(kept)] = kept
+
+    # Only show the columns used by the current modes
+    column_order = ["Label"]
+    if not simple_mode:
+        column_order.append("Magnitude (N)")
+    column_order.append("Angle (degrees)" if angled_mode else "Direction")
+    column_order.append("Color")
+
+    # Force inputs are a single table in a form, so editing them does not rerun the app
+    with st.form("fbd"):
+        force_rows = st.data_editor(
+            force_rows,
+            key="force_table",
+            hide_index=True,
+            column_order=column_order,
+            column_config={
+                "Label": st.column_config.TextColumn(required=True),
+                "Magnitude (N)": st.column_config.NumberColumn(min_value=0, step=1, required=True),
+                "Direction": st.column_config.SelectboxColumn(options=DIRECTION_OPTIONS, required=True),
+                "Angle (degrees)": st.column_config.NumberColumn(step=1, required=True),
+                "Color": st.column_config.SelectboxColumn(options=COLOR_NAMES, required=True),
+            },
+        )
+        submitted = st.form_submit_button("Generate Diagram")
+    st.session_state.force_rows = force_rows
+
+    if submitted:
         try:
-            fig = draw_fbd(forces, directions, labels, colors, caption, motion_arrow, simple_mode, angled_mode, angles, motion_direction)
-
-            # Display the diagram
-            buf = BytesIO()
-            fig.savefig(buf, format="png", bbox_inches="tight")
-            buf.seek(0)
-            st.image(buf, caption="Free Body Diagram", use_container_width=True)
-
-            # Download options
-            st.download_button("Download as PNG", data=buf, file_name="free_body_diagram.png", mime="image/png")
+            # Read the per-force values used by the current modes
+            forces = force_rows["Magnitude (N)"] if not simple_mode else [1] * num_forces  # Equal arrows in simple mode
+            directions = force_rows["Direction"] if not angled_mode else [""] * num_forces  # Use angles for direction in angled mode
+            angles = force_rows["Angle (degrees)"] if angled_mode else [0] * num_forces
+            labels = force_rows["Label"]
+            colors = [COLOR_RGBA[color] for color in force_rows["Color"]]
+
+            # Tuples keep the inputs hashable for the render cache
+            inputs = (tuple(forces), tuple(directions), tuple(labels), tuple(colors), caption, motion_arrow, simple_mode, angled_mode, tuple(angles), motion_direction)
+
+            # Only serialize again when the inputs differ from the last generated diagram
+            if st.session_state.get("last_inputs") != inputs:
+                st.session_state.last_png = serialize(inputs, "png", PREVIEW_DPI, get_figure_state())
+                st.session_state.last_inputs = inputs
         except Exception as e:
             st.error(f"An error occurred: {e}")
 
+    # Display the last generated diagram, including on reruns from unrelated widgets
+    if "last_png" in st.session_state:
+        st.image(st.session_state.last_png, caption="Free Body Diagram", use_container_width=True)
+
+        # Download options, rendered at full resolution only when the button is clicked
+        inputs, state = st.session_state.last_inputs, get_figure_state()
+        st.download_button("Download as PNG", data=lambda: serialize(inputs, "png", EXPORT_DPI, state), file_name="free_body_diagram.png", mime="image/png", on_click="ignore")
+
 if __name__ == "__main__":
     main()